@@ -27,7 +27,8 @@
 #
 
 from __future__ import annotations
-import hashlib, math, miniirc, miniirc_extras, os, random, re, sys, time
+import functools, hashlib, math, miniirc, miniirc_extras, os, queue, random, \
+    re, sys, threading, time
 assert miniirc.ver >= (1,4,3), 'Update miniirc.'
 assert miniirc_extras.ver >= (0,2,5), 'Update miniirc_extras.'
 
@@ -35,7 +36,8 @@ from miniirc_extras import AbstractIRC, Hostmask
 from miniirc_extras.features.chans import Channel, ModeList, ChannelTracker
 from miniirc_extras.features.users import AbstractChannel, User, UserTracker
 
-from typing import Optional, Union
+from operator import itemgetter
+from typing import AbstractSet, Callable, Optional, Union
 
 __version__ = '2.3.2'
 
@@ -53,22 +55,28 @@ def plural(n: int) -> str:
     return '' if n == 1 else 's'
 
 # Get a valid Lua representation of a string
-def _escape_string(x: bytes):
-    yield '"'
-    for char in x:
-        if char == 0x22: # "
-            yield r'\"'
-        elif char == 0x5c:
-            yield r'\\'
-        elif 0x7f > char > 0x1f:
-            yield chr(char)
-        else:
-            yield '\\' + str(char).zfill(3)
+def _lua_escape(char: int) -> str:
+    if char == 0x22: # "
+        return r'\"'
+    elif char == 0x5c:
+        return r'\\'
+    elif 0x7f > char > 0x1f:
+        return chr(char)
+    return '\\' + str(char).zfill(3)
+
+# Every byte's escaped form, computed once at import time
+_lua_escapes: tuple[str, ...] = tuple(map(_lua_escape, range(256)))
 
-    yield '"'
+# Bytes that can be used inside a Lua string without being escaped
+_lua_safe = bytes(c for c in range(0x20, 0x7f) if c not in (0x22, 0x5c))
 
 def lua_repr(s: str) -> str:
-    return ''.join(_escape_string(s.encode('utf-8')))
+    x = s.encode('utf-8')
+
+    # Skip escaping entirely if every byte is safe (this is the common case)
+    if not x.translate(None, _lua_safe):
+        return '"' + s + '"'
+    return '"' + ''.join(map(_lua_escapes.__getitem__, x)) + '"'
 
 # A player action error
 class ModerationError(Exception):
@@ -83,30 +91,40 @@ def _parse_duration(duration: Union[str, int, float]) -> int:
     """
 
     if isinstance(duration, str):
-        for suffix, m in _durations.items():
-            if duration.endswith(suffix):
-                duration = duration[:-len(suffix)]
-                multiplier = m
-                break
-        else:
-            multiplier = 60
-        try:
-            duration = float(duration)
-        except ValueError:
-            raise ModerationError('Invalid duration!')
-    else:
-        multiplier = 1
+        return _parse_duration_str(duration)
 
-    duration = math.floor(duration * multiplier)
+    # math.floor() raises an exception if given infinity or NaN
+    if not math.isfinite(duration):
+        raise ModerationError('Invalid duration!')
+
+    duration = math.floor(duration)
     if duration <= 0:
         raise ModerationError('The duration must be at least one second!')
     return duration
 
+# The same few durations tend to get used over and over again. Invalid
+#   durations raise ModerationError and are therefore never cached.
+@functools.lru_cache(maxsize=512)
+def _parse_duration_str(duration: str) -> int:
+    # All suffixes are one or two characters long
+    if (m := _durations.get(duration[-2:])) is not None:
+        duration, multiplier = duration[:-2], m
+    elif (m := _durations.get(duration[-1:])) is not None:
+        duration, multiplier = duration[:-1], m
+    else:
+        multiplier = 60
+    try:
+        n = float(duration)
+    except ValueError:
+        raise ModerationError('Invalid duration!')
+
+    return _parse_duration(n * multiplier)
+
 # A player class
 class Player(str):
     total_warnings: int = 2
     warnings: int
-    __slots__ = ('warnings', '_server')
+    __slots__ = ('warnings', '_server', '_key')
 
     # Kick the player
     def kick(self, sender: str, reason: str) -> None:
@@ -128,6 +146,17 @@ class Player(str):
         self._server.msg(f'cmd grant {self} shout')
 
     # Tempmute the player with //lua hacks
+    _tempmute_template: str = ('cmd /lua local m={player};'
+        'core.registered_chatcommands.revoke.func("trackr",m.." shout")'
+        'local function r() '
+            'if m then '
+                'core.registered_chatcommands.grant.func("trackr",'
+                    'm.." shout") '
+            'end '
+        'end '
+        'core.after({duration},r);'
+        'core.register_on_shutdown(r)')
+
     def tempmute(self, duration: Union[str, int, float]) -> None:
         assert self._server
         duration = _parse_duration(duration)
@@ -136,19 +165,18 @@ class Player(str):
                 'hours!')
 
         # Create a hacky lua script
-        script = (f'cmd /lua local m={lua_repr(self)};'
-            'core.registered_chatcommands.revoke.func("trackr",m.." shout")'
-            'local function r() '
-                'if m then '
-                    'core.registered_chatcommands.grant.func("trackr",'
-                        'm.." shout") '
-                'end '
-            'end '
-           f'core.after({duration},r);'
-            'core.register_on_shutdown(r)')
-        self._server.msg(script)
+        self._server.msg(self._tempmute_template.format(player=lua_repr(self),
+            duration=duration))
 
     # Warn the player
+    _warn_template: str = ('cmd /lua core.show_formspec({player},'
+        '"trackr:warning", "size[8,5;]image[0,0;1,1;bucket_lava.png]'
+        'image[7,0;1,1;bucket_lava.png]'
+        'label[1.25,0.25;WARNING - Please read carefully.]'
+        'label[0,1.25;" .. minetest.formspec_escape({msg}) .. "]'
+        'button_exit[0,4.5;8,0.5;quit;Continue]'
+        '" .. (default.gui_bg or ""))')
+
     def warn(self, sender: str, msg: str) -> str:
         assert self._server
 
@@ -163,13 +191,8 @@ class Player(str):
 
         msg = f'{msg}\n -- {sender}\n\nYou have {msg2}'
 
-        self._server.msg(f'cmd /lua core.show_formspec({lua_repr(self)},'
-            '"trackr:warning", "size[8,5;]image[0,0;1,1;bucket_lava.png]'
-            'image[7,0;1,1;bucket_lava.png]'
-            'label[1.25,0.25;WARNING - Please read carefully.]'
-           f'label[0,1.25;" .. minetest.formspec_escape({lua_repr(msg)}) .. "]'
-            'button_exit[0,4.5;8,0.5;quit;Continue]'
-            '" .. (default.gui_bg or ""))')
+        self._server.msg(self._warn_template.format(player=lua_repr(self),
+            msg=lua_repr(msg)))
 
         return self + ' has ' + msg2.replace('you', 'they')
 
@@ -204,6 +227,15 @@ class Player(str):
             self.warnings = warnings
 
         self._server: Optional[User] = server
+        self._key: str = sys.intern(name.lower())
+
+# Get the PlayerList key for a player name, Player objects store their key so
+#   that it doesn't have to be lowercased on every lookup. Player keys are
+#   interned so that the same player on multiple servers shares one key.
+def _player_key(key: str) -> str:
+    if isinstance(key, Player):
+        return key._key
+    return str(key).lower()
 
 # A player list
 class PlayerList(dict):
@@ -215,31 +247,32 @@ class PlayerList(dict):
         if not name:
             return None
 
-        if name in self:
-            player = self[name]
-        else:
+        # Only lowercase the name and look it up once
+        key = _player_key(name)
+        player = super().get(key)
+        if player is None:
             player = Player(name, warnings, server = self.server)
-            self[name] = player
+            super().__setitem__(player._key, player)
         return player
 
     def get(self, key: str, *args):
-        return super().get(str(key).lower(), *args)
+        return super().get(_player_key(key), *args)
 
     def __getitem__(self, key: str):
-        return super().__getitem__(str(key).lower())
+        return super().__getitem__(_player_key(key))
 
     def __setitem__(self, key: str, value: Player):
-        return super().__setitem__(str(key).lower(), value)
+        return super().__setitem__(_player_key(key), value)
 
     def __delitem__(self, key: str):
-        return super().__delitem__(str(key).lower())
+        return super().__delitem__(_player_key(key))
 
     def __contains__(self, key) -> bool:
-        return super().__contains__(str(key).lower())
+        return super().__contains__(_player_key(key))
 
-    def __init__(self, *args, **kwargs) -> None:
+    def __init__(self, *args, server: Optional[User] = None, **kwargs) -> None:
         super().__init__(*args, **kwargs)
-        self.server: Optional[User] = None
+        self.server: Optional[User] = server
 
     Player = Player_
     del Player_
@@ -248,11 +281,15 @@ class PlayerList(dict):
 _connected_players_re = re.compile(
     r'^(?:\d+ )?connected player(?:s|\(s\))?: (.*)$', re.IGNORECASE
 )
+_player_split_re = re.compile(r'[,\s]+')
 
 
 # The bot
 class Trackr:
     cooldown: int = 15
+    msg_delay: float = 0.5
+    moderation_cmds: frozenset[str] = frozenset({'kick', 'mute', 'unmute',
+        'tempmute', 'warn', 'tempban', 'unban'})
     irc: AbstractIRC
 
     # Alias for self.irc.debug
@@ -280,18 +317,39 @@ class Trackr:
         self.cooldowns: dict[str, float] = {}
         self.cooldown_msgs_sent: set[str] = set()
 
-        self._conf_assert('ip', ('ssl_port', int), 'nick', 'channels',
-            'admins')
+        # The bot's nick and its lowercase form (see _lc_current_nick)
+        self._current_nick: tuple[str, str] = ('', '')
+
+        # Lowercased player names -> servers the player is on
+        self._player_index: dict[str, set[User]] = {}
+        self._indexed_servers: set[User] = set()
+        self._player_index_lock = threading.Lock()
+
+        # Messages that are sent slowly (see _msg_queue_worker)
+        self._msg_queue: queue.Queue[tuple[str, str]] = queue.Queue()
+
+        # Command handlers
+        self._cmds: dict[str, Callable[[str, str, Hostmask, str, str], None]]
+        self._cmds = dict.fromkeys(self.moderation_cmds, self._moderate_cmd)
+        self._cmds.update(players=self._players_cmd,
+            badservers=self._badservers_cmd, die=self._die_cmd)
+
+        self._conf_assert(('ip', 'nick', 'channels', 'admins'),
+            {'ssl_port': int})
 
         self._secret: bytes = config.get('secret', '').encode('utf-8')
-        self.admins: frozenset[str] = frozenset(map(
-            lambda n : n.strip().lower(), config['admins'].split(',')))
+        self._secret_suffix: bytes = b', secret: ' + self._secret
+        self._passwords: dict[tuple[str, str], str] = {}
+        self.admins: frozenset[str] = frozenset(sys.intern(n.strip().lower())
+            for n in config['admins'].split(',') if n.strip())
         self.prefix = config.get('prefix', config['nick'] + ': ')
+        self._prefix_len = len(self.prefix)
 
         self.server_list: Optional[frozenset[str]] = None
         serverlist = config.get('server_list', '').strip()
         if serverlist:
-            self.server_list = frozenset(map(str.strip, serverlist.split(',')))
+            self.server_list = frozenset(sys.intern(n.strip().lower())
+                for n in serverlist.split(',') if n.strip()) or None
 
         self.server_mode: str = config.get('server_mode', 'v')
         if len(self.server_mode) != 1:
@@ -326,25 +384,39 @@ class Trackr:
         # Add handlers
         self.irc.Handler('PRIVMSG', colon=False)(self._handle_privmsg)
         self.irc.Handler('JOIN', colon=False)(self._handle_join)
+        self.irc.Handler('001', 'PART', 'KICK', 'QUIT',
+            colon=False)(self._handle_leave)
 
         # Connect
+        threading.Thread(target=self._msg_queue_worker, daemon=True).start()
         self.irc.connect()
 
-    # Function copied from lurklite
-    def _conf_assert(self, *keys: Union[str, tuple[str, type]]) -> None:
-        for key in keys:
-            req: Optional[type] = None
-            if isinstance(key, tuple):
-                key, req = key
-
-            if key not in self.config:
-                err('Required config value {} missing!', repr(key))
-            elif req:
-                try:
-                    req(self.config[key])
-                except:
-                    err('Config value {} contains an invalid {}.', repr(key),
-                        req.__name__)
+    # Based on a function from lurklite. Keys in typed are also required.
+    def _conf_assert(self, required: tuple[str, ...],
+            typed: Optional[dict[str, type]] = None) -> None:
+        typed = typed or {}
+        missing = [key for key in (*required, *typed)
+                   if key not in self.config]
+        if missing:
+            err('Required config value{} {} missing!', plural(len(missing)),
+                ', '.join(map(repr, missing)))
+
+        for key, req in typed.items():
+            try:
+                req(self.config[key])
+            except ValueError:
+                err('Config value {} contains an invalid {}.', repr(key),
+                    req.__name__)
+
+    # Get the bot's current nick in lowercase, this is only lowercased again
+    #   if the nick changes.
+    def _lc_current_nick(self) -> str:
+        nick, lnick = self._current_nick
+        current_nick: str = self.irc.current_nick
+        if current_nick != nick:
+            lnick = sys.intern(current_nick.lower())
+            self._current_nick = (current_nick, lnick)
+        return lnick
 
     # Check if a hostmask is a server
     def is_server(self, channel: Union[str, AbstractChannel],
@@ -361,15 +433,25 @@ class Trackr:
                     hostmask = self.users[hostmask]
                 return 'players' in hostmask.keys()
 
-        modes = self.server_list or channel.modes.getset(self.server_mode)
-
         if isinstance(hostmask, User):
             hostmask = hostmask.hostmask
         elif not isinstance(hostmask, Hostmask):
             raise TypeError('is_server() expects User or hostmask.')
 
+        # server_list is lowercased when the config is loaded
+        if self.server_list is not None:
+            return hostmask[0].lower() in self.server_list
+
+        modes = self._mode_set(channel, self.server_mode)
         return hostmask[0] in modes or hostmask[0].lower() in modes
 
+    # Get the nicks with a list mode without copying the set (unlike
+    #   ModeList.getset()). The set may be changed by other threads, so it
+    #   should only be used for membership checks.
+    def _mode_set(self, channel: Channel, mode: str) -> AbstractSet[str]:
+        res = channel.modes.get(mode)
+        return res if isinstance(res, set) else frozenset()
+
     # Check if a user is an admin
     def is_admin(self, channel: Union[str, AbstractChannel],
             hostmask: Union[Hostmask, User, str]) -> bool:
@@ -386,33 +468,133 @@ class Trackr:
         else:
             nick = hostmask
 
+        # Most nicks are already lowercase and only need to be checked once
         lnick: str = nick.lower()
+        check_lnick: bool = lnick != nick
 
         for mode in 'oaq':
-            users = channel.modes.getset(mode)
-            if nick in users or lnick in users:
+            users = self._mode_set(channel, mode)
+            if nick in users or (check_lnick and lnick in users):
                 return True
 
         return False
 
+    # Check if a hostmask belongs to a bot admin (who can use login and die)
+    def _is_admin_host(self, hostmask: Hostmask) -> bool:
+        return hostmask[-1].rpartition('/')[2].lower() in self.admins
+
     # Derive a password from a hostmask
     def get_password(self, hostmask: Hostmask, legacy: bool = False) -> str:
         host = '/'.join(hostmask[2].split('/', 3)[:3])
         if legacy:
             host = '.'.join(host.split('.', 2)[:2])
-        pw   = f'{hostmask[0]}@{host}'.encode('utf-8')
-        pw  += b', secret: ' + self._secret
+
+        # Passwords are requested multiple times for the same server (for
+        #   example when logging in and then running setpassword)
+        key = (hostmask[0], host)
+        if key in self._passwords:
+            return self._passwords[key]
 
         # Hash it
-        return hashlib.sha512(pw).hexdigest()
+        h = hashlib.sha512(f'{hostmask[0]}@{host}'.encode('utf-8'))
+        h.update(self._secret_suffix)
+        self._passwords[key] = res = h.hexdigest()
+        return res
+
+    # Update the player index, handlers run in separate threads so this is
+    #   done with self._player_index_lock held.
+    def _index_player(self, server: User, player: Player) -> None:
+        with self._player_index_lock:
+            key = _player_key(player)
+            self._player_index.setdefault(key, set()).add(server)
+            self._indexed_servers.add(server)
+
+    def _unindex_player(self, server: User, player: str) -> None:
+        with self._player_index_lock:
+            self._unindex_player_locked(server, _player_key(player))
+
+    def _unindex_player_locked(self, server: User, key: str) -> None:
+        servers = self._player_index.get(key)
+        if servers and server in servers:
+            servers.remove(server)
+            if not servers:
+                del self._player_index[key]
+
+    # Remove every player on a server from the player index
+    def _unindex_server(self, server: User) -> None:
+        players: Optional[PlayerList] = server.get('players')
+        with self._player_index_lock:
+            for player in tuple(players or ()):
+                self._unindex_player_locked(server, player)
+            self._indexed_servers.discard(server)
+
+    # Get the servers that might have a player on them
+    def _indexed_player_servers(self, player: str) -> tuple[User, ...]:
+        with self._player_index_lock:
+            return tuple(self._player_index.get(_player_key(player), ()))
+
+    # Check if a User object is still being tracked, miniirc_extras creates new
+    #   User objects when servers rejoin and after reconnecting.
+    def _is_tracked(self, user: User) -> bool:
+        try:
+            return bool(user.channels) and self.users[user.nick] is user
+        except KeyError:
+            return False
+
+    # Remove servers that are no longer tracked from the player index
+    def _prune_player_index(self) -> None:
+        with self._player_index_lock:
+            servers = tuple(self._indexed_servers)
+        for server in servers:
+            if not self._is_tracked(server):
+                self._unindex_server(server)
+
+    # Give a server a new (empty) player list
+    def _new_player_list(self, server: User) -> PlayerList:
+        self._unindex_server(server)
+        server['players'] = players = PlayerList(server = server)
+        return players
+
+    # Send queued messages one at a time so that handlers don't have to
+    #   sleep between every message
+    def _msg_queue_worker(self) -> None:
+        while True:
+            target, msg = self._msg_queue.get()
+            try:
+                self.irc.msg(target, msg)
+            except Exception as e:
+                # Don't let one failed message stop every queued message from
+                #   being sent
+                print(f'[trackr] WARNING: Could not send message to '
+                      f'{target!r}: {e!r}', file=sys.stderr)
+            time.sleep(self.msg_delay)
+
+    def _queue_msg(self, target: str, *msg: str) -> None:
+        self._msg_queue.put((target, ' '.join(msg)))
 
     # Get an iterable list with servers
     def servers(self, channel: Union[AbstractChannel, str]):
         if isinstance(channel, str):
             channel = self.chans[channel]
 
+        if not isinstance(channel, Channel):
+            for user in channel.users:
+                if self.is_server(channel, user):
+                    yield user
+            return
+
+        # Only get the server list once rather than once per user
+        server_list = self.server_list
+        if server_list is not None:
+            for user in channel.users:
+                if user.nick.lower() in server_list:
+                    yield user
+            return
+
+        modes = self._mode_set(channel, self.server_mode)
         for user in channel.users:
-            if self.is_server(channel, user):
+            nick: str = user.nick
+            if nick in modes or nick.lower() in modes:
                 yield user
 
     # Get a list of both servers and players
@@ -421,7 +603,8 @@ class Trackr:
             yield server, server.get('players')
 
     # The players command
-    def _players_cmd(self, channel: str, nick: str) -> None:
+    def _players_cmd(self, channel: str, nick: str, hostmask: Hostmask,
+            cmd: str, param: str) -> None:
         irc: AbstractIRC = self.irc
 
         t = time.monotonic()
@@ -439,11 +622,14 @@ class Trackr:
         total: int    = 0
         inactive: int = 0
         tplayers: int = 0
-        slist: list[tuple[User, PlayerList]] = list(self.items(channel))
-        slist.sort(key = lambda s : s[0].nick.lower())
+        slist: list[tuple[str, User, PlayerList]] = [
+            (server.nick.lower(), server, players)
+            for server, players in self.items(channel)
+        ]
+        slist.sort(key=itemgetter(0))
 
         # Iterate over every server in the channel
-        for server, players in slist:
+        for _, server, players in slist:
             if not players:
                 inactive += 1
                 continue
@@ -451,13 +637,12 @@ class Trackr:
             tplayers += len(players)
             players2: list[Player] = list(players.values())
             players2.sort()
-            irc.msg(channel, 'Players on \2{}\2: {}'.format(server.nick,
-                ', '.join(players2)))
-            self.cooldowns[channel] += 0.5
-            time.sleep(0.5)
+            self._queue_msg(channel, 'Players on \2{}\2: {}'.format(
+                server.nick, ', '.join(players2)))
+            self.cooldowns[channel] += self.msg_delay
 
         # Display the summary
-        irc.msg(channel, ('Total: \2{} player{}\2 across \2{} active '
+        self._queue_msg(channel, ('Total: \2{} player{}\2 across \2{} active '
             'server{}\2 (and {} empty server{}).').format(tplayers,
             plural(tplayers), total, plural(total), inactive,
             plural(inactive)))
@@ -488,6 +673,44 @@ class Trackr:
 
         irc.msg(nick, 'I will attempt to log in.')
 
+    # The moderation commands
+    def _moderate_cmd(self, channel: str, nick: str, hostmask: Hostmask,
+            cmd: str, param: str) -> None:
+        self.irc.msg(channel, nick + ': ' + self._moderate(channel, hostmask,
+            cmd, param))
+
+    # The badservers command
+    def _badservers_cmd(self, channel: str, nick: str, hostmask: Hostmask,
+            cmd: str, param: str) -> None:
+        irc: AbstractIRC = self.irc
+        if not self._secret:
+            irc.msg(channel, f'{nick}: As moderation is disabled, no '
+                    f'attempt has been made to log in to servers.')
+            return
+        bad: list[str] = sorted((s_.nick for s_ in self.servers(channel)
+                                 if not s_.get('logged_in')), key=str.lower)
+        if not bad:
+            bad.append('(none)')
+        irc.msg(channel,
+            f'{nick}: Servers I am not logged into: {", ".join(bad)}')
+
+    # The die command
+    def _die_cmd(self, channel: str, nick: str, hostmask: Hostmask, cmd: str,
+            param: str) -> None:
+        irc: AbstractIRC = self.irc
+        if self._is_admin_host(hostmask):
+            msg = f'{nick} ordered me to die- wait, why did I listen?'
+            irc.disconnect(msg)
+            print(msg)
+            os._exit(0)
+        else:
+            msg = random.choice(("But I don't want to die.", 'No.',
+                'Resistance is futile.', 'Sorry, what was that?',
+                'You know I could ignore you all day.',
+                "I'm going to pretend you didn't say that.",
+                'die: Singular form of dice.'))
+            irc.msg(channel, f'{nick}: {msg}')
+
     # Handle the moderation commands
     def _moderate(self, channel: str, hostmask: Hostmask, cmd: str,
             param: str) -> str:
@@ -523,11 +746,15 @@ class Trackr:
                             'been sent anyway.')
                 return f'The player {victim!r} is not in {server.nick}.'
         else:
-            for s, p in self.items(chan):
-                if p and victim in p:
-                    if server is not None:
-                        return 'Error: That player is in multiple servers!'
-                    server = s
+            # The index may briefly disagree with the player lists if
+            #   handlers run at the same time, so check both
+            servers = [s for s in self._indexed_player_servers(victim)
+                       if s in chan and self.is_server(chan, s)
+                       and victim in s.get('players', ())]
+            if len(servers) > 1:
+                return 'Error: That player is in multiple servers!'
+            elif servers:
+                server = servers[0]
 
         if not server:
             return 'Unknown player!'
@@ -574,61 +801,31 @@ class Trackr:
                 msg  = n[1].strip()
             del n
 
+        # Check for commands
+        cmd_start: Optional[int] = None
         if msg.startswith('.players'):
-            msg = self.prefix + msg[1:]
+            cmd_start = 1
+        elif msg.startswith(self.prefix):
+            cmd_start = self._prefix_len
 
-        # Check for commands
-        if msg.startswith(self.prefix):
-            cmd_args = msg[len(self.prefix):].split(' ', 1)
+        if cmd_start is not None:
+            cmd_args = msg[cmd_start:].split(' ', 1)
             cmd = cmd_args[0].lower()
 
-            if irc.current_nick.lower() == args[0].lower():
+            if self._lc_current_nick() == args[0].lower():
                 if cmd != 'login':
                     irc.msg(hostmask[0],
                         'You may not execute commands in PMs.')
-                elif hostmask[-1].split('/')[-1].lower() in self.admins:
+                elif self._is_admin_host(hostmask):
                     self._login_cmd(hostmask[0], cmd_args[-1])
                 else:
                     irc.msg(hostmask[0], 'Permission denied!')
                 return
 
-            if cmd == 'players':
-                return self._players_cmd(channel, nick)
-            elif cmd in ('kick', 'mute', 'unmute', 'tempmute', 'warn',
-                    'tempban', 'unban'):
-                irc.msg(channel, nick + ': ' + self._moderate(channel,
-                    hostmask, cmd, cmd_args[1] if len(cmd_args) > 1 else ''))
-                return
-            elif cmd == 'badservers':
-                if not self._secret:
-                    irc.msg(channel, f'{nick}: As moderation is disabled, no '
-                            f'attempt has been made to log in to servers.')
-                    return
-                bad = []
-                for s_ in self.servers(channel):
-                    if not s_.get('logged_in'):
-                        bad.append(s_.nick)
-                if bad:
-                    bad.sort(key = lambda n : n.lower())
-                else:
-                    bad.append('(none)')
-                irc.msg(channel,
-                    f'{nick}: Servers I am not logged into: {", ".join(bad)}')
-                return
-            elif cmd == 'die':
-                if hostmask[-1].split('/')[-1].lower() in self.admins:
-                    msg = f'{nick} ordered me to die- wait, why did I listen?'
-                    irc.disconnect(msg)
-                    print(msg)
-                    os._exit(0)
-                else:
-                    msg = random.choice(("But I don't want to die.", 'No.',
-                        'Resistance is futile.', 'Sorry, what was that?',
-                        'You know I could ignore you all day.',
-                        "I'm going to pretend you didn't say that.",
-                        'die: Singular form of dice.'))
-                    irc.msg(channel, f'{nick}: {msg}')
-
+            handler = self._cmds.get(cmd)
+            if handler:
+                handler(channel, nick, hostmask, cmd,
+                    cmd_args[1] if len(cmd_args) > 1 else '')
                 return
 
         if nick != hostmask[0] or not self.is_server(channel, hostmask):
@@ -642,27 +839,39 @@ class Trackr:
             players = server['players'] # type: ignore
             assert isinstance(players, PlayerList)
         else:
-            server['players'] = players = PlayerList()
-            players.server = server
+            players = self._new_player_list(server)
 
         if msg.startswith('*** '):
             a: list[str] = msg.split(' ', 3)
             if len(a) <= 2:
                 return
             if a[2] == 'joined':
-                players.Player(a[1])
+                if pobj := players.Player(a[1]):
+                    self._index_player(server, pobj)
             elif a[2] == 'left' and a[1] in players:
                 del players[a[1]]
+                self._unindex_player(server, a[1])
             del a
-        elif match := _connected_players_re.match(msg):
-            new_players: list[str] = match.group(1).replace(' ', '').split(',')
-            for player in new_players:
-                players.Player(player)
-
-            for player, pobj in tuple(players.items()):
-                if str(pobj) not in new_players:
-                    print('Deleting player', repr(pobj))
-                    del players[player]
+        elif ': ' in msg and (match := _connected_players_re.match(msg)):
+            # Lowercased names -> player names
+            new_players: dict[str, str] = {}
+            for player in _player_split_re.split(match.group(1)):
+                if player:
+                    new_players[player.lower()] = player
+
+            # Only add and remove players that have changed
+            old_players = players.keys()
+            for player in new_players.keys() - old_players:
+                # These players are known to be new so there's no need to use
+                #   players.Player() (which checks for an existing player)
+                pobj = Player(new_players[player], server = server)
+                players[pobj] = pobj
+                self._index_player(server, pobj)
+
+            for player in old_players - new_players.keys():
+                print('Deleting player', repr(players[player]))
+                del players[player]
+                self._unindex_player(server, player)
 
             # Log in
             if server.get('logged_in') is None and self._secret:
@@ -718,14 +927,21 @@ class Trackr:
             attempt % 2 == 0,
         )
 
+    # Handle PARTs, KICKs, QUITs, and 001s (reconnects)
+    def _handle_leave(self, irc: AbstractIRC, hostmask: Hostmask,
+            args: list[str]) -> None:
+        # Give miniirc_extras time to update its user list
+        time.sleep(1)
+        self._prune_player_index()
+
     # Handle JOINs
     def _handle_join(self, irc: AbstractIRC, hostmask: Hostmask,
             args: list[str]) -> None:
         time.sleep(1)
-        if hostmask[0].lower() == irc.current_nick.lower():
+        if hostmask[0].lower() == self._lc_current_nick():
+            self._prune_player_index()
             for server in self.servers(args[0]):
-                server['players'] = players = PlayerList()
-                players.server = server
+                self._new_player_list(server)
                 server.msg('players', '-',
                     'If you are a human, report this to the bot owner.')
             return
@@ -733,10 +949,7 @@ class Trackr:
         if not self.is_server(args[0], hostmask):
             return
 
-        user = self.users[hostmask]
-        players = PlayerList()
-        players.server = user
-        user['players'] = players
+        self._new_player_list(self.users[hostmask])
         irc.msg(hostmask[0],
             'players - If you are a human, report this to the bot owner.')
 